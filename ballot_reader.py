@@ -1,11 +1,23 @@
 import csv
 import json
-from collections import defaultdict
-from typing import Any, Mapping
+from collections import Counter, defaultdict
+from itertools import islice
+from operator import itemgetter
+from typing import Any, Mapping, MutableMapping
 
 from custom_types import Ballot
 from election_data import ElectionData, ElectionMetadata
 from position_data import PositionData
+from utils import gc_paused
+
+# Size of the read buffer for CSV files, large enough that a typical ballot file is read in a few system calls
+_CSV_BUFFER_SIZE = 1 << 20
+
+# Number of rows of the source CSV file held in memory at a time
+_CSV_CHUNK_SIZE = 1 << 16
+
+# Grades (as written in the CSV files) of the students eligible to vote
+_VALID_GRADES = frozenset({"9", "10", "11", "12"})
 
 
 def _check_key_exists_in_config(key: str, mapping: Mapping, key_path: str, config_filepath: str):
@@ -24,6 +36,123 @@ def _check_key_exists_in_config(key: str, mapping: Mapping, key_path: str, confi
         raise ValueError(f"Key '{key_path}' does not exist within {config_filepath}")
 
 
+def _read_email_grade_reference(reference: str) -> dict[str, str]:
+    """
+    Helper method which reads the reference CSV file mapping the emails of all students to their grades.
+
+    :param reference: the filepath to the reference CSV file.
+    :return: a mapping of emails to grades. Grades are kept as written in the reference file
+             and only converted when a ballot needs checking.
+    """
+    with open(reference, newline="", buffering=_CSV_BUFFER_SIZE) as file:
+        reader = csv.reader(file, delimiter=",")
+
+        # Skip the headers
+        next(reader, None)
+
+        return {row[0]: row[1] for row in reader}
+
+
+def _find_invalid_ballot_reason(grade: str, email: str, email_grade_reference: Mapping[str, str]) -> str | None:
+    """
+    Helper method which determines why a ballot cast by a voter is invalid.
+
+    :param grade: the grade entered on the ballot.
+    :param email: the email address of the voter.
+    :param email_grade_reference: a mapping of the emails of all students to their grades.
+    :return: the reason the ballot is invalid, or ``None`` if the ballot is valid.
+    """
+    grade = int(grade)
+
+    if not 9 <= grade <= 12:
+        return "Invalid Grade"
+
+    if email not in email_grade_reference:
+        return "Student Not Found"
+
+    if int(email_grade_reference[email]) != grade:
+        return "Grade Mismatch"
+
+    return None
+
+
+def _filter_valid_rows(
+        rows: list[list[str]],
+        email_grade_reference: Mapping[str, str],
+        invalid_ballots: MutableMapping[str, int]
+) -> list[list[str]]:
+    """
+    Helper method which filters out the rows of invalid ballots, tallying the reason each one is invalid.
+
+    :param rows: the rows of the source file, including the grade and email columns.
+    :param email_grade_reference: a mapping of the emails of all students to their grades.
+    :param invalid_ballots: a mapping of reasons to the number of ballots found invalid for that reason.
+    :return: the rows of the valid ballots.
+    """
+    valid_rows: list[list[str]] = []
+
+    for row in rows:
+        grade = row[1]
+        email = row[-1]
+
+        # A ballot whose grade matches the record of an eligible student exactly passes with
+        # a single lookup; any other ballot is classified in full
+        if not (grade in _VALID_GRADES and email_grade_reference.get(email) == grade):
+            invalid_reason = _find_invalid_ballot_reason(grade, email, email_grade_reference)
+
+            if invalid_reason is not None:
+                invalid_ballots[invalid_reason] += 1
+                continue
+
+        valid_rows.append(row)
+
+    return valid_rows
+
+
+def _compute_position_slices(
+        positions_metadata: Mapping[str, Mapping[str, Any]],
+        start: int,
+        config_filepath: str
+) -> list[tuple[str, int, int]]:
+    """
+    Helper method which validates the metadata of every position and computes the
+    range of columns occupied by each position's ballot within a row of the source file.
+
+    :param positions_metadata: a mapping of all positions to their metadata.
+    :param start: the index of the first column containing a choice.
+    :param config_filepath: the filepath to the configuration JSON file.
+    :return: a list of tuples containing the position name, and the start (inclusive)
+             and end (exclusive) column indices of its ballot.
+    :raises:
+        ValueError: if a position is missing a required key or has no candidates.
+    """
+    position_slices: list[tuple[str, int, int]] = []
+
+    for name, position_metadata in positions_metadata.items():
+        _check_key_exists_in_config(
+            "candidates",
+            position_metadata,
+            f"position.{name}.candidates",
+            config_filepath
+        )
+        _check_key_exists_in_config(
+            "num_winners",
+            position_metadata,
+            f"position.{name}.num_winners",
+            config_filepath
+        )
+
+        num_candidates = len(position_metadata["candidates"])
+
+        if num_candidates <= 0:
+            raise ValueError(f"Invalid amount of choices ({num_candidates}) for position ({name}).")
+
+        position_slices.append((name, start, start + num_candidates))
+        start += num_candidates
+
+    return position_slices
+
+
 class BallotReader:
     """
     Reads the ballot information from a csv file using the config JSON file specified
@@ -35,6 +164,22 @@ class BallotReader:
         :param config_filepath: the path of the configuration JSON file
         """
         self.config_filepath = config_filepath
+        self._config: dict[str, Any] | None = None
+
+    def _read_config(self) -> dict[str, Any]:
+        """
+        Reads and parses the configuration JSON file. The parsed configuration is cached,
+        so subsequent reads do not parse the file again.
+
+        :return: the parsed configuration mapping.
+        """
+        if self._config is None:
+            # The raw bytes are handed straight to the parser, which detects the encoding
+            # itself, instead of going through a text-mode file object
+            with open(self.config_filepath, "rb") as file:
+                self._config = json.loads(file.read())
+
+        return self._config
 
     def read(self):
         """
@@ -43,8 +188,7 @@ class BallotReader:
         :return: a tuple containing the output filepath, a list of ``PositionData`` instances representing the
         ballots and parameters of the election for a single position, and the total number of ballots
         """
-        with open(self.config_filepath) as file:
-            config_dict: dict[str, Any] = json.load(file)
+        config_dict = self._read_config()
 
         # Check for key existence
         _check_key_exists_in_config("source", config_dict, "source", self.config_filepath)
@@ -55,89 +199,76 @@ class BallotReader:
 
         source = config_dict["source"]
 
+        # If ballots are filtered using a reference file (which adds the grade and email columns)
+        has_reference = "reference" in config_dict
+
         # Mapping of all positions to their metadata (as a dictionary)
         positions_metadata: dict[str, dict[str, Any]] = config_dict["positions"]
 
         # Mapping of all positions to their ballots
-        vote_list: dict[str, list[Ballot]] = defaultdict(list)
+        vote_list: dict[str, Counter[Ballot]] = {}
 
-        email_grade_reference: dict[str, int] = {}
-
-        if "reference" in config_dict:
-            # Filtering invalid votes
-            reference = config_dict["reference"]
-
-            with open(reference) as file:
-                reader = csv.reader(file, delimiter=",")
+        # Column ranges of each position within a row, validated once before any ballot is read
+        position_slices = _compute_position_slices(
+            positions_metadata,
+            2 if has_reference else 1,
+            self.config_filepath
+        )
 
-                # Skip the headers
-                next(reader, None)
+        # Filtering invalid votes
+        email_grade_reference = _read_email_grade_reference(config_dict["reference"]) if has_reference else {}
 
-                for row in reader:
-                    email_grade_reference[row[0]] = int(row[1])
+        invalid_ballots: dict[str, int] = defaultdict(int) if has_reference else None
 
+        # Mapping of all positions to the raw choices of their ballots, counted across all valid rows
+        choice_counts: dict[str, Counter[tuple[str, ...]]] = {name: Counter() for name, _, _ in position_slices}
         num_ballots = 0
 
-        invalid_ballots: dict[str, int] = defaultdict(int) if "reference" in config_dict else None
-
-        with open(source) as file:
-            reader = csv.reader(file, delimiter=",")
-
-            # Skip the headers
-            next(reader, None)
-
-            # Assign ballots to positions
-            for i, row in enumerate(reader):
-                start = 2 if "reference" in config_dict else 1
-
-                if "reference" in config_dict:
-                    grade = int(row[1])
-                    email = row[-1]
-
-                    # Check for invalid ballots
-                    if not 9 <= grade <= 12:
-                        invalid_ballots["Invalid Grade"] += 1
-                        continue
-
-                    if email not in email_grade_reference:
-                        invalid_ballots["Student Not Found"] += 1
-                        continue
+        # Ballot rows and tuples are allocated in bulk and never form reference cycles,
+        # so collection passes triggered by those allocations would only rescan them
+        with gc_paused():
+            with open(source, newline="", buffering=_CSV_BUFFER_SIZE) as file:
+                reader = csv.reader(file, delimiter=",")
 
-                    if email_grade_reference[email] != grade:
-                        invalid_ballots["Grade Mismatch"] += 1
-                        continue
+                # Skip the headers
+                next(reader, None)
 
-                num_ballots += 1
+                # Rows are processed in fixed-size chunks, so only one chunk of rows is held in memory at a time
+                while chunk := list(islice(reader, _CSV_CHUNK_SIZE)):
+                    # Rows of the valid ballots within the chunk; without a reference, every ballot is valid
+                    if has_reference:
+                        rows = _filter_valid_rows(chunk, email_grade_reference, invalid_ballots)
+                    else:
+                        rows = chunk
 
-                for name, position_metadata in positions_metadata.items():
-                    _check_key_exists_in_config(
-                        "candidates",
-                        position_metadata,
-                        f"position.{name}.candidates",
-                        self.config_filepath
-                    )
-                    _check_key_exists_in_config(
-                        "num_winners",
-                        position_metadata,
-                        f"position.{name}.num_winners",
-                        self.config_filepath
-                    )
+                    num_ballots += len(rows)
 
-                    candidates = position_metadata["candidates"]
-                    num_candidates = len(candidates)
+                    # Slicing and counting run as a chain of built-ins, without a Python frame per row
+                    for name, start, end in position_slices:
+                        choice_counts[name].update(map(tuple, map(itemgetter(slice(start, end)), rows)))
 
-                    if num_candidates <= 0:
-                        raise ValueError(f"Invalid amount of choices ({num_candidates}) for position ({name}).")
+        # Assign ballots to positions. Identical rows have already been counted, so each
+        # distinct ballot is only checked and encoded once
+        for name, counts in choice_counts.items():
+            # Maps each candidate to its index, in which ballots are encoded
+            candidate_indices = {
+                candidate: index for index, candidate in enumerate(positions_metadata[name]["candidates"])
+            }
 
-                    ballot = tuple(row[start:(start + num_candidates)])
+            # Mapping of each distinct ballot to the number of times it was cast
+            ballots: Counter[Ballot] = Counter()
 
-                    if not all(ballot):
-                        start += num_candidates
-                        continue
+            for choices, count in counts.items():
+                if "" in choices:
+                    continue
 
-                    vote_list[name].append(ballot)
+                try:
+                    ballots[tuple(map(candidate_indices.__getitem__, choices))] = count
+                except KeyError as e:
+                    raise ValueError(f"Unknown candidate {e} for position ({name}) in {source}") from None
 
-                    start += num_candidates
+            if ballots:
+                vote_list[name] = ballots
 
         # List of position metadata
         position_data_list: list[PositionData] = []
@@ -146,18 +277,20 @@ class BallotReader:
         show_display = bool(config_dict["show_display"])
 
         for position, ballots in vote_list.items():
+            position_metadata = positions_metadata[position]
+
             # Reads the election threshold parameter, defaulting to the global value if needed
-            if "threshold" in config_dict["positions"][position]:
-                threshold = float(config_dict["positions"][position]["threshold"])
+            if "threshold" in position_metadata:
+                threshold = float(position_metadata["threshold"])
             else:
                 threshold = global_threshold
 
             position_data_list.append(
                 PositionData(
                     name=position,
-                    ballots=vote_list[position],
-                    candidates=config_dict["positions"][position]["candidates"],
-                    num_winners=int(config_dict["positions"][position]["num_winners"]),
+                    ballots=ballots,
+                    candidates=position_metadata["candidates"],
+                    num_winners=int(position_metadata["num_winners"]),
                     threshold=threshold
                 )
             )
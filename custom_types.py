@@ -1,10 +1,13 @@
 from collections.abc import MutableMapping
 from typing import Annotated
 
-Ballot = tuple[str, ...]
+Ballot = Annotated[
+    tuple[int, ...],
+    "A ranked ballot, as the indices of the chosen candidates (within the position's candidate list) in order."
+]
 VoteDict = Annotated[
-    MutableMapping[str, list[Ballot]],
+    MutableMapping[int, list[Ballot]],
     "A mutable mapping representing a vote distribution dictionary at a stage in an election."
-    "The dictionary maps candidates to the specific ballots that count towards its vote total."
+    "The dictionary maps candidates (by index) to the specific ballots that count towards its vote total."
 ]
 
@@ -1,3 +1,4 @@
+from collections import Counter
 from dataclasses import dataclass
 
 from custom_types import Ballot
@@ -12,12 +13,21 @@ class PositionData:
     :param candidates: the list of candidates running for the position
     :param num_winners: the number of candidates required for the position
     :param threshold: a float determining the minimum percentage of votes required for a majority.
+    :param ballots: a mapping of each distinct ballot cast for the position (as indices into ``candidates``)
+                    to the number of times it was cast.
     """
     name: str
     candidates: list[str]
     num_winners: int
     threshold: float
-    ballots: list[Ballot]
+    ballots: Counter[Ballot]
+
+    @property
+    def num_ballots(self):
+        """
+        :return: the total number of ballots cast for this position.
+        """
+        return self.ballots.total()
 
     @property
     def num_candidates(self):
@@ -1,20 +1,24 @@
-from collections import deque
-from collections.abc import Generator
-
 from ballot_reader import BallotReader
-from ranked_choice_display import RankedChoiceDisplay
+from position_data import PositionData
 from ranked_choice_runner import RankedChoiceRunner
 
+_OUTPUT_BUFFER_SIZE = 1 << 20
+
 
-def _exhaust(generator: Generator):
+def _create_runner(position_metadata: PositionData):
     """
-    Exhausts a (finite) generator.
+    Creates the runner for the election of a position.
 
-    :param generator: the generator to exhaust
+    :param position_metadata: the data of the position whose election is run.
+    :return: a new runner for the election of the position.
     """
-    # Constructs a deque of length zero, which causes values of the generator
-    # to be repeatedly added and removed
-    deque(generator, maxlen=0)
+    return RankedChoiceRunner(
+        position_metadata.ballots,
+        candidates=position_metadata.candidates,
+        candidates_required=position_metadata.num_winners,
+        ballot_size=position_metadata.num_candidates,
+        threshold=position_metadata.threshold,
+    )
 
 
 class RankedChoiceApplication:
@@ -34,59 +38,56 @@ class RankedChoiceApplication:
         self.vote_list = election_data.position_data_list
         self.invalid_ballots = election_data.invalid_ballots
 
+        # Runners of the elections already run without the display, by position name. The election data
+        # is read once above, so their results stay valid for later calls to run()
+        self._decided_runners: dict[str, RankedChoiceRunner] = {}
+
     def run(self):
         """
         Runs all elections for all candidates to completion
         """
+        # Results are written as each position is decided rather than collected and written at the end.
+        # Each section is preceded by its blank separator line so that the file does not end with an extra one
+        with open(self.output_file, 'w', buffering=_OUTPUT_BUFFER_SIZE) as output:
+            output.write(f"Total Ballots: {self.num_ballots}\n")
+
+            if self.invalid_ballots is not None:
+                invalid_ballots_count = sum(self.invalid_ballots.values())
+
+                output.write(f"\nInvalid Ballots: {invalid_ballots_count}\n")
+
+                for key, value in self.invalid_ballots.items():
+                    output.write(f"\t{key}: {value}\n")
 
-        file_output: list[str] = [
-            f"Total Ballots: {self.num_ballots}",
-            "",
-        ]
-
-        if self.invalid_ballots is not None:
-            invalid_ballots_count = sum(self.invalid_ballots.values())
-
-            file_output.append(
-                f"Invalid Ballots: {invalid_ballots_count}",
-            )
-
-            for key, value in self.invalid_ballots.items():
-                file_output.append(f"\t{key}: {value}")
-
-            file_output.append("")
-
-        for position_metadata in self.vote_list:
-            election_runner = RankedChoiceRunner(
-                position_metadata.ballots,
-                candidates=position_metadata.candidates,
-                candidates_required=position_metadata.num_winners,
-                ballot_size=position_metadata.num_candidates,
-                threshold=position_metadata.threshold,
-            )
-
-            if self.show_display:
-                election_display = RankedChoiceDisplay(
-                    election_runner,
-                    title=position_metadata.name,
-                )
-
-                election_display.run_election_display()
-            else:
-                for run in election_runner.run_election():
-                    _exhaust(run)
-
-            file_output.append(f"Winners for {position_metadata.name} (candidates: {position_metadata.num_winners}; "
-                               f"threshold: {position_metadata.threshold},"
-                               f"number of ballots: {len(position_metadata.ballots)}):")
-
-            for winner in election_runner.winners:
-                if winner in election_runner.notes:
-                    file_output.append(f"{winner} ({', '.join(election_runner.notes[winner])})")
+            for position_metadata in self.vote_list:
+                if self.show_display:
+                    election_runner = _create_runner(position_metadata)
+
+                    # Imported here so that headless runs do not pay for loading matplotlib
+                    from ranked_choice_display import RankedChoiceDisplay
+
+                    election_display = RankedChoiceDisplay(
+                        election_runner,
+                        title=position_metadata.name,
+                    )
+
+                    election_display.run_election_display()
                 else:
-                    file_output.append(winner)
+                    election_runner = self._decided_runners.get(position_metadata.name)
+
+                    if election_runner is None:
+                        election_runner = _create_runner(position_metadata)
+                        election_runner.run_election_headless()
+
+                        self._decided_runners[position_metadata.name] = election_runner
+
+                output.write(f"\nWinners for {position_metadata.name} (candidates: {position_metadata.num_winners}; "
+                             f"threshold: {position_metadata.threshold},"
+                             f"number of ballots: {position_metadata.num_ballots}):\n")
 
-            file_output.append("")
+                for winner in election_runner.winners:
+                    if winner in election_runner.notes:
+                        output.write(f"{winner} ({', '.join(election_runner.notes[winner])})\n")
+                    else:
+                        output.write(f"{winner}\n")
 
-        with open(self.output_file, 'w') as output:
-            output.write("\n".join(file_output))
@@ -1,110 +1,108 @@
-from collections import defaultdict
+import gc
+from collections.abc import Mapping
+from itertools import accumulate, chain, zip_longest
 
 from matplotlib.axes import Axes
 from matplotlib.backend_bases import Event
 from matplotlib.figure import Figure
 from matplotlib.widgets import Button
 
-from custom_types import VoteDict, Ballot
+from custom_types import Ballot
 
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 from ranked_choice_runner import RankedChoiceRunner
+from runoff_stage import RunoffStage
 from utils import make_ordinal
 
+# Delay (in milliseconds) over which clicks of the 'next' and 'prev' buttons are coalesced into one redraw
+_STAGE_CHANGE_DELAY = 16
 
-def _transform_votes(votes: VoteDict):
+
+def _transform_votes(stage: RunoffStage):
     """
-    Transform a ``MutableMapping[str, list[Ballot]]`` into 3 separate lists
-    representing candidate names, ballot lists, and ballot counts.
+    Transform a ``RunoffStage`` into 2 separate lists representing candidate indices and ballot counts.
 
-    :arg votes the ``VoteDict`` to transform.
-    :return three lists in a tuple representing the candidates, ballots, and ballot counts.
+    :arg stage the ``RunoffStage`` to transform.
+    :return two lists in a tuple representing the candidates and ballot counts.
     """
-    candidates = list(votes.keys())
-    ballots = list(votes.values())
-    ballots_counts = [len(ballots) for ballots in ballots]
+    candidates = list(stage.vote_counts.keys())
+    ballots_counts = list(stage.vote_counts.values())
 
-    return candidates, ballots, ballots_counts
+    return candidates, ballots_counts
 
 
-def _display_ballots(candidate: str, ballots: list[Ballot]):
+def _count_ballot_places(candidate: int,
+                         ballots: list[Ballot],
+                         ballot_weights: Mapping[Ballot, int],
+                         ballot_ranks: Mapping[Ballot, Mapping[int, int]],
+                         ballot_size: int) -> list[int]:
     """
-    Displays the vote distribution (1st, 2nd, 3rd, ...) on a bar chart using matplotlib.
-
-    :arg candidate the candidate whose votes are displayed.
-    :arg ballots the ballots for the candidate.
+    Counts the votes for a candidate by the rank at which they were cast.
+
+    :arg candidate the index of the candidate whose votes are counted.
+    :arg ballots the distinct ballots for the candidate.
+    :arg ballot_weights a mapping of each distinct ballot to the number of times it was cast.
+    :arg ballot_ranks a mapping of each distinct ballot to the ranks of its candidates.
+    :arg ballot_size the size of each ballot.
+    :return a list where the value at each index i is the amount of votes cast at rank i + 1.
     """
-    if len(ballots) == 0:
-        return
-
-    # Maps the vote rank to the amount of votes
-    ballot_place_counts: defaultdict[int, int] = defaultdict(int)
+    ballot_place_counts = [0] * ballot_size
 
     for ballot in ballots:
-        try:
-            idx = ballot.index(candidate)
-        except ValueError:
+        idx = ballot_ranks[ballot].get(candidate)
+
+        if idx is None:
             continue
 
-        ballot_place_counts[idx + 1] += 1
+        ballot_place_counts[idx] += ballot_weights[ballot]
 
-    # No valid ballots
-    if len(ballot_place_counts) == 0:
-        return
+    return ballot_place_counts
 
-    subplots: tuple[Figure, Axes] = plt.subplots()
-    fig, axes = subplots
 
-    labels = []
-    bars = []
+def _display_ballots(axes: Axes, candidate: str, ballot_place_counts: list[int]):
+    """
+    Displays the vote distribution (1st, 2nd, 3rd, ...) on a bar chart using matplotlib.
+
+    :arg axes the empty axes on which the chart is drawn.
+    :arg candidate the name of the candidate whose votes are displayed.
+    :arg ballot_place_counts a list where the value at each index i is the amount of votes cast at rank i + 1.
+                             At least one rank must have votes.
+    """
+    sorted_keys = [key for key, count in enumerate(ballot_place_counts, 1) if count]
 
     # Creates a Prefix Sum Array where the value at each index i
     # is the sum of the votes ranked higher than or equal to i + 1.
     # E.g. index 2 is the sum of the first and second ranked votes
-    sorted_keys = sorted(ballot_place_counts.keys())
-    sorted_values = [ballot_place_counts[key] for key in sorted_keys]
-    ballots_psa = [sorted_values[0]]
+    sorted_values = [ballot_place_counts[key - 1] for key in sorted_keys]
+    ballots_psa = list(accumulate(sorted_values))
 
-    for i, key in enumerate(sorted_keys):
-        if i == 0:
-            continue
-
-        ballots_psa.append(ballots_psa[i - 1] + sorted_values[i])
-
-    # Plot metadata
+    # Plot metadata (vote counts are positive, so the last prefix sum is the largest)
     axes.yaxis.set_major_locator(MaxNLocator(integer=True))
-    plt.ylim([0, max(ballots_psa) * 1.2])
-    plt.title(f"Vote Distribution for {candidate}")
-
-    ballots_psa.reverse()
-
-    # Construct bars
-    for i, key in enumerate(reversed(sorted_keys)):
-        labels.append(f"{make_ordinal(key)} choice")
-
-        # Create bar
-        bar = axes.bar(
-            ["Vote Distribution"],
-            ballots_psa[i],
-            align="center",
-        )
-
-        bars.append(bar)
-
-        prev_height = 0 if i == len(ballots_psa) - 1 else ballots_psa[i + 1]
-
-        # Computes label value and location
-        num_votes = ballots_psa[i] - prev_height
-        text_height = ballots_psa[i]
-        axes.text(bar[0].get_x() + bar[0].get_width() / 2., text_height,
+    axes.set_ylim([0, ballots_psa[-1] * 1.2])
+    axes.set_title(f"Vote Distribution for {candidate}")
+
+    # Construct the bar as one stack of segments, one per rank, each starting where the ranks above it end.
+    # Segments are listed from the lowest rank to the highest, which is the order shown in the legend
+    labels = [f"{make_ordinal(key)} choice" for key in reversed(sorted_keys)]
+    heights = sorted_values[::-1]
+    bottoms = [0, *ballots_psa[:-1]][::-1]
+
+    bars = axes.bar(
+        ["Vote Distribution"] * len(heights),
+        heights,
+        bottom=bottoms,
+        color=[f"C{i}" for i in range(len(heights))],
+        align="center",
+    )
+
+    # Label each segment with its amount of votes
+    for bar, num_votes in zip(bars, heights):
+        axes.text(bar.get_x() + bar.get_width() / 2., bar.get_y() + bar.get_height(),
                   str(num_votes),
                   ha='center', va='bottom')
 
-    plt.legend(tuple(bars), tuple(labels))
-    plt.show(block=False)
-
-    return fig
+    axes.legend(bars.patches, labels)
 
 
 class _ElectionDisplay:
@@ -112,7 +110,7 @@ class _ElectionDisplay:
     Helper class that displays the stages of one election run (where one candidate is elected).
     """
 
-    def __init__(self, *, stages: list[VoteDict], runner: RankedChoiceRunner, title: str):
+    def __init__(self, *, stages: list[RunoffStage], runner: RankedChoiceRunner, title: str):
         """
         :param stages: the state of the ballot distribution at each point in the election.
         :param runner: the runner responsible for running the election. Contains useful election metadata.
@@ -123,11 +121,28 @@ class _ElectionDisplay:
         self.title = title
         self.index = 0
 
+        # The stage to display once the pending stage change is applied
+        self._target_index = 0
+        self._update_pending = False
+
+        # Stages are never mutated, so each one is transformed only once
+        self._transformed_stages = [_transform_votes(stage) for stage in stages]
+
         self.candidates = []
-        self.ballots = []
         self.ballot_counts = []
         self.textboxes = []
-        self.distribution_figures = []
+
+        # A single figure, created on the first bar click, displays the vote distribution of the clicked candidate
+        self.distribution_figure: Figure | None = None
+        self._distribution_axes: Axes | None = None
+
+        # Saved on each full redraw for blitting; the tick labels are tracked to detect when one is required
+        self._blit_canvas = None
+        self._background = None
+        self._tick_labels: list[str] | None = None
+
+        # Vote distributions are memoized by (stage index, candidate)
+        self._ballot_place_counts: dict[tuple[int, int], list[int]] = {}
 
         self._init_election_display()
 
@@ -137,39 +152,111 @@ class _ElectionDisplay:
         closing the chart window if the end is reached.
         """
         # Closes the chart window
-        if self.index >= len(self.stages) - 1:
-            self._close_distribution_figures()
+        if self._target_index >= len(self.stages) - 1:
+            self._update_timer.stop()
+            self._update_pending = False
+            self._close_distribution_figure()
             plt.close(self.fig)
+
+            # Closed figures are only freed by the cyclic garbage collector, so the figures of
+            # the window are collected at once rather than lingering into the next election
+            gc.collect()
             return
 
-        self.index += 1
+        self._target_index += 1
+        self._schedule_update()
 
-        votes = self.stages[self.index]
-        self.candidates, self.ballots, self.ballot_counts = _transform_votes(votes)
+    def _prev(self):
+        """
+        Moves the displayed chart to the previous stage of the election.
+        """
+        if self._target_index <= 0:
+            return
 
-        self._update_graph()
+        self._target_index -= 1
+        self._schedule_update()
 
-    def _prev(self):
+    def _schedule_update(self):
         """
-        Moves the displayed chart to the next stage of the election,
-        closing the chart window if the end is reached.
+        Schedules the chart to be redrawn at the target stage. Stage changes made before the
+        redraw happens are applied together, so rapid clicks only redraw the chart once.
+        """
+        if not self._update_pending:
+            self._update_pending = True
+            self._update_timer.start()
+
+    def _flush_update(self):
+        """
+        Applies the pending stage change, redrawing the chart at the target stage.
         """
-        if self.index <= 0:
+        self._update_pending = False
+
+        if self._target_index == self.index:
             return
 
-        self.index -= 1
+        self.index = self._target_index
 
-        votes = self.stages[self.index]
-        self.candidates, self.ballots, self.ballot_counts = _transform_votes(votes)
+        self.candidates, self.ballot_counts = self._transformed_stages[self.index]
 
         self._update_graph()
 
-    def _close_distribution_figures(self):
+    def _candidate_names(self):
+        """
+        :return: the names of the candidates in the displayed stage, in display order.
+        """
+        return [self._runner.candidates[candidate] for candidate in self.candidates]
+
+    def _get_ballot_place_counts(self, candidate: int):
         """
-        Closes the figures displaying vote distributions for candidates.
+        Gets the vote distribution of a candidate at the current stage, computing it on first use.
+
+        :param candidate: the index of the candidate.
+        :return: a list where the value at each index i is the amount of votes cast at rank i + 1.
         """
-        for fig in self.distribution_figures:
-            plt.close(fig)
+        key = (self.index, candidate)
+
+        if key not in self._ballot_place_counts:
+            ballots = self.stages[self.index].candidate_ballots(candidate)
+
+            self._ballot_place_counts[key] = _count_ballot_places(
+                candidate, ballots, self._runner.ballots, self._runner.ballot_ranks, self._runner.ballot_size
+            )
+
+        return self._ballot_place_counts[key]
+
+    def _show_distribution(self, candidate: int):
+        """
+        Displays the vote distribution of a candidate at the current stage,
+        reusing the distribution figure if it is still open.
+
+        :param candidate: the index of the candidate.
+        """
+        ballot_place_counts = self._get_ballot_place_counts(candidate)
+
+        # No valid ballots
+        if not any(ballot_place_counts):
+            return
+
+        if self.distribution_figure is None or not plt.fignum_exists(self.distribution_figure.number):
+            subplots: tuple[Figure, Axes] = plt.subplots()
+            self.distribution_figure, self._distribution_axes = subplots
+
+            _display_ballots(self._distribution_axes, self._runner.candidates[candidate], ballot_place_counts)
+            plt.show(block=False)
+        else:
+            self._distribution_axes.clear()
+
+            _display_ballots(self._distribution_axes, self._runner.candidates[candidate], ballot_place_counts)
+            self.distribution_figure.canvas.draw_idle()
+
+    def _close_distribution_figure(self):
+        """
+        Closes the figure displaying vote distributions for candidates.
+        """
+        if self.distribution_figure is not None:
+            plt.close(self.distribution_figure)
+            self.distribution_figure = None
+            self._distribution_axes = None
 
     def _bar_click_handler(self, e: Event):
         """
@@ -177,58 +264,95 @@ class _ElectionDisplay:
 
         :param e the event object, containing event metadata.
         """
-        for candidate, ballots, rect in zip(self.candidates, self.ballots, self.rects):
+        for candidate, rect in zip(self.candidates, self.rects):
             if rect.contains(e)[0]:
-                fig = _display_ballots(candidate, ballots)
-
-                self.distribution_figures.append(fig)
+                self._show_distribution(candidate)
 
     def _update_graph(self):
         """
         Updates the vote chart display.
         """
         # Resetting graph
-        self._close_distribution_figures()
+        self._close_distribution_figure()
 
-        for textbox in self.textboxes:
-            textbox.remove()
+        # Sets ticks, which requires a layout pass, only when the candidates have changed
+        candidate_names = self._candidate_names()
+        ticks_changed = candidate_names != self._tick_labels
 
-        self.textboxes.clear()
+        if ticks_changed:
+            self.axes.set_xticks(range(len(self.candidates)), candidate_names)
+            self._tick_labels = candidate_names
 
-        for rect in self.rects:
-            rect.set_height(0)
+        # Sets the rectangles to the appropriate height, flattening (and hiding the labels of)
+        # those left over from candidates eliminated before this stage. A bar's height, color and
+        # label only depend on its count, so bars still showing the same count are left untouched
+        for i, (rect, textbox, ballot_count) in enumerate(zip_longest(self.rects, self.textboxes, self.ballot_counts)):
+            if ballot_count == self._bar_counts[i]:
+                continue
+
+            self._bar_counts[i] = ballot_count
 
-        # Sets ticks
-        self.axes.set_xticks(range(len(self.candidates)), self.candidates)
+            if ballot_count is None:
+                rect.set_height(0)
+                textbox.set_visible(False)
+                continue
 
-        # Sets the rectangles to the appropriate height
-        for rect, ballot_count in zip(self.rects, self.ballot_counts):
             rect.set_height(ballot_count)
 
             # Changes color if a majority is attained
-            if ballot_count > self._runner.majority:
+            if ballot_count >= self._runner.majority:
                 rect.set_color("red")
             else:
                 rect.set_color("blue")
 
-            height = rect.get_height()
-            textbox = self.axes.text(rect.get_x() + rect.get_width() / 2., height,
-                                     str(ballot_count),
-                                     ha='center', va='bottom')
+            textbox.set_y(rect.get_height())
+            textbox.set_text(str(ballot_count))
+            textbox.set_visible(True)
 
-            self.textboxes.append(textbox)
+        # Redraw, blitting only the bars and labels onto the saved background when nothing else has changed
+        if ticks_changed or self._background is None:
+            self.fig.canvas.draw()
+        else:
+            self.fig.canvas.restore_region(self._background)
+            self._draw_animated_artists()
+            self.fig.canvas.blit(self.fig.bbox)
 
-        # Redraw
-        self.fig.canvas.draw()
-        plt.pause(0.02)
+        # The chart has already been drawn, so the GUI only needs to process the pending events to show it
+        self.fig.canvas.flush_events()
+
+    def _on_draw(self, e: Event):
+        """
+        Handles the draw event which occurs on every full redraw of the figure,
+        saving the static background for blitting and drawing the bars and labels over it.
+
+        :param e the event object, containing event metadata.
+        """
+        # Draws made while saving the figure use another canvas, which cannot be blitted,
+        # so the bars and labels are drawn straight onto the saved output
+        if e.canvas is not self._blit_canvas:
+            for artist in chain(self.rects, self.textboxes):
+                artist.draw(e.renderer)
+
+            return
+
+        self._background = self._blit_canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated_artists()
+
+    def _draw_animated_artists(self):
+        """
+        Draws the bars and vote count labels, which are excluded from full redraws when blitting.
+        """
+        for rect in self.rects:
+            self.axes.draw_artist(rect)
+
+        for textbox in self.textboxes:
+            self.axes.draw_artist(textbox)
 
     def _init_election_display(self):
         """
         Initialized the vote chart display by drawing the initial stage and setting up event listeners.
         """
-        initial_vote = self.stages[0]
-
-        self.candidates, self.ballots, self.ballot_counts = _transform_votes(initial_vote)
+        self.candidates, self.ballot_counts = self._transformed_stages[0]
 
         subplots: tuple[Figure, Axes] = plt.subplots()
         self.fig, self.axes = subplots
@@ -257,17 +381,40 @@ class _ElectionDisplay:
         prev_button = Button(ax_prev, 'Prev')
         prev_button.on_clicked(lambda e: self._prev())
 
+        # One-shot timer which applies the pending stage change
+        self._update_timer = self.fig.canvas.new_timer(interval=_STAGE_CHANGE_DELAY)
+        self._update_timer.single_shot = True
+        self._update_timer.add_callback(self._flush_update)
+
         # Constructs initial bar chart
         self.rects = self.axes.bar(
-            self.candidates,
+            self._candidate_names(),
             self.ballot_counts,
             color="blue",
             align="center",
         )
 
+        # Constructs the vote count labels, one per bar, which are reused at every stage
+        self.textboxes = [
+            self.axes.text(rect.get_x() + rect.get_width() / 2., 0, "", ha='center', va='bottom')
+            for rect in self.rects
+        ]
+
+        # The count shown by each bar (``None`` once flattened), where -1 marks a bar not yet updated
+        self._bar_counts: list[int | None] = [-1] * len(self.rects)
+
         # Attach listener to graph itself to display vote distributions
         self.fig.canvas.mpl_connect('button_press_event', lambda e: self._bar_click_handler(e))
 
+        # Bars and labels are blitted over a saved background where the backend supports it
+        if self.fig.canvas.supports_blit:
+            self._blit_canvas = self.fig.canvas
+
+            for artist in chain(self.rects, self.textboxes):
+                artist.set_animated(True)
+
+            self.fig.canvas.mpl_connect('draw_event', lambda e: self._on_draw(e))
+
         self._update_graph()
 
         plt.pause(0.5)
@@ -1,58 +1,234 @@
 from collections import defaultdict
-from collections.abc import Set, Mapping, MutableMapping
+from collections.abc import Collection, Iterable, Mapping, MutableMapping
+from copy import copy
+from itertools import chain
 from typing import Callable, Literal
 
 from custom_types import Ballot, VoteDict
+from runoff_stage import RunoffStage
 from utils import make_ordinal
 
 
-def _copy_vote_dict(votes: VoteDict) -> VoteDict:
+def _select_removable_candidates(vote_counts: Mapping[int, int]) -> frozenset[int]:
     """
-    Performs a shallow copy of a ``VoteDict``, where the contained ballots retain their object identity.
+    Selects a set of the candidates which are eliminated via instant runoff (they have the lowest number of votes).
 
-    :param votes: the ``VoteDict`` to copy
-    :return: a new shallow copy of the ``VoteDict``
+    :param vote_counts: a mapping of candidates to their vote totals from which to compute the removable candidates
+    :return: a set of candidates which are to be eliminated from the runoff
     """
-    new_vote_dict: VoteDict = defaultdict(list)
+    min_votes = None
+    eliminated_candidates = []
 
-    for candidate, ballots in votes.items():
-        new_vote_dict[candidate] = ballots.copy()
+    # Tracks the lowest vote total and the candidates having it in a single pass
+    for candidate, count in vote_counts.items():
+        if min_votes is None or count < min_votes:
+            min_votes = count
+            eliminated_candidates = [candidate]
+        elif count == min_votes:
+            eliminated_candidates.append(candidate)
 
-    return new_vote_dict
+    return frozenset(eliminated_candidates)
 
 
-def _select_removable_candidates(votes: VoteDict) -> Set[str]:
+def _compute_tiebreaker_winner(tiebreaker_dict: Mapping[int, int]):
     """
-    Selects a set of the candidates which are eliminated via instant runoff (they have the lowest number of votes).
+    Helper method which computes the winner of a point-system tiebreaker
 
-    :param votes: the VoteDict from which to compute the removable candidates
-    :return: a set of candidates which are to be eliminated from the runoff
+    :param tiebreaker_dict: a mapping of candidates to points
+    :return: the winning candidate or ``None`` if no winner can be determined
+    :raises:
+        ValueError: if ``tiebreaker_dict`` is empty.
     """
-    min_votes = min([len(ballots) for _, ballots in votes.items()])
+    if not tiebreaker_dict:
+        raise ValueError("No candidate was awarded tiebreaker points.")
 
-    eliminated_candidates = set()
+    winner = None
+    max_points = -1
+    tied = False
 
-    for candidate, ballots in votes.items():
-        if len(ballots) == min_votes:
-            eliminated_candidates.add(candidate)
+    # Tracks the leading candidate and whether the lead is shared in a single pass
+    for candidate, points in tiebreaker_dict.items():
+        if points > max_points:
+            winner = candidate
+            max_points = points
+            tied = False
+        elif points == max_points:
+            tied = True
 
-    return eliminated_candidates
+    return None if tied else winner
 
 
-def _compute_tiebreaker_winner(tiebreaker_dict: Mapping[str, int]):
+def _count_ballot_points(ballots: Mapping[Ballot, int],
+                         ballot_ranks: Mapping[Ballot, Mapping[int, int]],
+                         ballot_size: int,
+                         num_candidates: int) -> list[int]:
     """
-    Helper method which computes the winner of a point-system tiebreaker
+    Totals the tiebreaker points of every candidate over the given ballots, where a vote at rank ``r``
+    (0-based) is worth ``ballot_size - r`` points.
+
+    :param ballots: a mapping of distinct ballots to the number of times they were cast.
+    :param ballot_ranks: a mapping of each distinct ballot to the ranks of its candidates.
+    :param ballot_size: the size of each ballot.
+    :param num_candidates: the number of candidates in the election.
+    :return: the points of each candidate, indexed by candidate.
+    """
+    points = [0] * num_candidates
 
-    :param tiebreaker_dict: a mapping of candidates to points
-    :return: the winning candidate or ``None`` if no winner can be determined
+    for ballot, count in ballots.items():
+        for candidate, rank in ballot_ranks[ballot].items():
+            points[candidate] += (ballot_size - rank) * count
+
+    return points
+
+
+def _awarded_points(points: list[int], candidates: Iterable[int]) -> dict[int, int]:
     """
-    max_points = max([point for point in tiebreaker_dict.values()])
-    point_winners = [candidate for candidate, points in tiebreaker_dict.items() if points == max_points]
+    Collects the tiebreaker points of the candidates who were awarded any. A ranked candidate is always
+    awarded at least one point, so candidates ranked on none of the counted ballots are left out.
 
-    if len(point_winners) == 1:
-        return point_winners[0]
-    else:
-        return None
+    :param points: the points of each candidate, indexed by candidate.
+    :param candidates: the candidates taking part in the tiebreaker.
+    :return: a mapping of candidates to points.
+    """
+    return {candidate: points[candidate] for candidate in candidates if points[candidate]}
+
+
+def _rank_ballots(ballots: Iterable[Ballot]) -> dict[Ballot, dict[int, int]]:
+    """
+    Maps each distinct ballot to a mapping of the candidates on it to their (0-based) rank.
+    A candidate ranked more than once keeps their highest rank, as with ``ballot.index``.
+
+    :param ballots: the distinct ballots to rank.
+    :return: a mapping of each ballot to its candidate ranks.
+    """
+    ballot_ranks = {}
+
+    for ballot in ballots:
+        ranks = {}
+
+        for rank, candidate in enumerate(ballot):
+            ranks.setdefault(candidate, rank)
+
+        ballot_ranks[ballot] = ranks
+
+    return ballot_ranks
+
+
+def _next_choice(ballot: Ballot, position: int, eliminated: list[bool]) -> int:
+    """
+    Finds the position of the highest ranked candidate on a ballot who is not eliminated.
+
+    :param ballot: the ballot to search.
+    :param position: the position on the ballot from which to search.
+    :param eliminated: a mask of the eliminated candidates, indexed by candidate.
+    :return: the position of the candidate, or ``len(ballot)`` if every remaining candidate is eliminated.
+    """
+    ballot_size = len(ballot)
+
+    while position < ballot_size and eliminated[ballot[position]]:
+        position += 1
+
+    return position
+
+
+class _BallotDistribution:
+    """
+    The distribution of the distinct ballots of an election among the candidates who are not eliminated.
+    Each ballot keeps a cursor to its current choice and each candidate keeps a running vote total, so
+    ballots are never copied or mutated, and eliminating a candidate only touches that candidate's ballots.
+    """
+
+    def __init__(self, ballots: list[Ballot], weights: list[int], eliminated: list[bool]):
+        """
+        Assigns each ballot to its highest ranked candidate who is not eliminated.
+
+        :param ballots: the distinct ballots of the election.
+        :param weights: the number of times each ballot was cast, in the order of ``ballots``.
+        :param eliminated: a mask of the eliminated candidates, indexed by candidate.
+        """
+        self.ballots = ballots
+        self.weights = weights
+        self.eliminated = eliminated
+
+        # The position of each ballot's current choice, the indices of the ballots
+        # assigned to each candidate, and the vote total of each candidate
+        self.positions = [0] * len(ballots)
+        self.piles: list[list[int]] = [[] for _ in eliminated]
+        self.tallies = [0] * len(eliminated)
+
+        for i, ballot in enumerate(ballots):
+            position = _next_choice(ballot, 0, eliminated)
+            self.positions[i] = position
+
+            if position < len(ballot):
+                candidate = ballot[position]
+                self.piles[candidate].append(i)
+                self.tallies[candidate] += weights[i]
+
+    def copy(self):
+        """
+        :return: a copy of the distribution which can be changed independently. The ballots and weights are shared.
+        """
+        distribution = copy(self)
+        distribution.eliminated = self.eliminated.copy()
+        distribution.positions = self.positions.copy()
+        distribution.piles = [pile.copy() for pile in self.piles]
+        distribution.tallies = self.tallies.copy()
+
+        return distribution
+
+    def eliminate(self, eliminated_candidates: Collection[int]):
+        """
+        Eliminates candidates, transferring their ballots to the next choices which are not eliminated.
+
+        :param eliminated_candidates: the candidates to be eliminated.
+        """
+        # Bound locally, as this is the innermost loop of the runoff
+        ballots, weights, eliminated = self.ballots, self.weights, self.eliminated
+        positions, piles, tallies = self.positions, self.piles, self.tallies
+
+        for candidate in eliminated_candidates:
+            eliminated[candidate] = True
+
+        for eliminated_candidate in eliminated_candidates:
+            for i in piles[eliminated_candidate]:
+                ballot = ballots[i]
+                position = _next_choice(ballot, positions[i] + 1, eliminated)
+                positions[i] = position
+
+                if position < len(ballot):
+                    candidate = ballot[position]
+                    piles[candidate].append(i)
+                    tallies[candidate] += weights[i]
+
+            # The pile itself is kept as it was, as stages of the runoff may still refer to it
+            tallies[eliminated_candidate] = 0
+
+    def count_votes(self, candidates: Iterable[int]) -> dict[int, int]:
+        """
+        :param candidates: the candidates to count, in order.
+        :return: a mapping of the given candidates who are not eliminated to their vote totals.
+        """
+        return {candidate: self.tallies[candidate] for candidate in candidates if not self.eliminated[candidate]}
+
+    def stage(self, vote_counts: dict[int, int]) -> RunoffStage:
+        """
+        :param vote_counts: a mapping of the candidates who are not eliminated to their vote totals.
+        :return: a snapshot of the current stage of the runoff.
+        """
+        return RunoffStage(
+            vote_counts=vote_counts,
+            ballots=self.ballots,
+            piles=self.piles,
+            pile_sizes={candidate: len(self.piles[candidate]) for candidate in vote_counts},
+        )
+
+    def vote_dict(self, candidates: Iterable[int]) -> VoteDict:
+        """
+        :param candidates: the candidates to include, in order.
+        :return: a new ballot distribution dictionary (``VoteDict``) of the given candidates.
+        """
+        return {candidate: [self.ballots[i] for i in self.piles[candidate]] for candidate in candidates}
 
 
 class RankedChoiceRunner:
@@ -61,7 +237,7 @@ class RankedChoiceRunner:
     """
 
     def __init__(self,
-                 data: list[Ballot],
+                 data: Mapping[Ballot, int],
                  *,
                  candidates: list[str],
                  ballot_size: int,
@@ -69,7 +245,8 @@ class RankedChoiceRunner:
                  threshold: float = 0.5
                  ):
         """
-        :param data: a list of all ballots in the election, as a list of tuples of strings.
+        :param data: a mapping of each distinct ballot in the election (a tuple of indices into ``candidates``)
+                     to the number of times it was cast.
         :param candidates: the list of candidates running in the election.
         :param ballot_size: the size of each ballot.
         :param candidates_required: the number of candidates required for the elected position.
@@ -86,21 +263,52 @@ class RankedChoiceRunner:
             raise ValueError("Number of required candidates exceed number of available candidates. ")
 
         self._data = data
-        self._majority = int(len(self._data) * threshold) + 1
-        self._eliminated: set[str] = set()
+        self._num_ballots = sum(data.values())
+        self._majority = int(self._num_ballots * threshold) + 1
+        self._ballot_ranks: dict[Ballot, dict[int, int]] | None = None
+
+        # The second tiebreaker points of every candidate over all ballots, which are computed
+        # on first use and shared by the tiebreakers of every seat
+        self._total_points: list[int] | None = None
+
         self._candidates = candidates
+        self._candidate_indices = {candidate: index for index, candidate in enumerate(candidates)}
         self._candidates_running = len(candidates)
         self._ballot_size = ballot_size
         self._candidates_required = candidates_required
         self.winners: set[str] = set()
         self.notes: MutableMapping = defaultdict(list)
 
+        # Candidates ranked on no ballot can never receive a vote, so they are left out of the runoffs
+        # (unless they are needed to fill the required seats)
+        ranked_candidates = set(chain.from_iterable(data))
+        self._contested_candidates = [
+            candidate for candidate in range(self._candidates_running) if candidate in ranked_candidates
+        ]
+
+        if len(self._contested_candidates) < candidates_required:
+            self._contested_candidates = list(range(self._candidates_running))
+
     @property
     def num_ballots(self):
         """
         :return: The total number of ballots in the election.
         """
-        return len(self._data)
+        return self._num_ballots
+
+    @property
+    def ballots(self):
+        """
+        :return: A mapping of each distinct ballot in the election to the number of times it was cast.
+        """
+        return self._data
+
+    @property
+    def candidates(self):
+        """
+        :return: The list of candidates running in the election, indexed by the candidate indices used in ballots.
+        """
+        return self._candidates
 
     @property
     def candidates_running(self):
@@ -130,111 +338,149 @@ class RankedChoiceRunner:
         """
         return self._majority
 
+    @property
+    def ballot_ranks(self):
+        """
+        :return: A mapping of each distinct ballot in the election to a mapping of the candidates on it
+                 to their (0-based) rank. It is built on first use.
+        """
+        if self._ballot_ranks is None:
+            self._ballot_ranks = _rank_ballots(self._data)
+
+        return self._ballot_ranks
+
     def run_election(self):
         """
         Runs the election.
 
-        :return: a generator which generates generators which generates a ballot distribution dictionary (``VoteDict``)
-                 for each stage in the election.
+        :return: a generator which generates generators which generates a snapshot (``RunoffStage``)
+                 of each stage in the election.
         """
+        initial_distribution = self._distribute_ballots()
+
         for _ in range(self._candidates_required):
-            votes: VoteDict = {}
+            yield self._runoff_generator(self._start_seat(initial_distribution))
+
+    def run_election_headless(self):
+        """
+        Runs the election to completion without recording its stages.
+        """
+        initial_distribution = self._distribute_ballots()
 
-            for candidate in self._candidates:
-                votes[candidate] = []
+        for _ in range(self._candidates_required):
+            distribution = self._start_seat(initial_distribution)
+            vote_counts = distribution.count_votes(self._contested_candidates)
 
-            # Construct initial ballot distribution dictionary (VoteDict)
-            for ballot in self._data:
-                votes[ballot[0]].append(ballot)
+            while not self._has_majority(vote_counts):
+                eliminated_candidates = _select_removable_candidates(vote_counts)
 
-            # Redistribute votes that belong to already-decided winners
-            self._eliminated.clear()
-            self._transfer_votes(votes, self.winners)
+                # There is a tie
+                if len(eliminated_candidates) == len(vote_counts):
+                    break
 
-            for eliminated_candidate in self.winners:
-                del votes[eliminated_candidate]
+                distribution.eliminate(eliminated_candidates)
+                vote_counts = distribution.count_votes(vote_counts)
 
-            yield self._runoff_generator(votes)
+            self._add_winner(distribution.vote_dict(vote_counts), vote_counts)
 
     def reset(self):
         """
         Resets the election to be run again.
         """
-        self._eliminated = set()
         self.winners = set()
+        self.notes = defaultdict(list)
+
+    def _distribute_ballots(self) -> _BallotDistribution:
+        """
+        :return: the distribution of the first preferences of all ballots among the contested candidates.
+        """
+        # Candidates left out of the runoffs start eliminated
+        eliminated = [True] * self._candidates_running
+
+        for candidate in self._contested_candidates:
+            eliminated[candidate] = False
+
+        return _BallotDistribution(list(self._data), list(self._data.values()), eliminated)
+
+    def _start_seat(self, initial_distribution: _BallotDistribution) -> _BallotDistribution:
+        """
+        Starts the runoff for the next seat. Each seat starts again from the first preferences, where the
+        ballots of already-decided winners are redistributed.
+
+        :param initial_distribution: the distribution of the first preferences of all ballots.
+        :return: the initial distribution of the next seat.
+        """
+        winners = [self._candidate_indices[winner] for winner in self.winners]
+
+        distribution = initial_distribution.copy()
+        distribution.eliminate(winners)
 
-    def _runoff_generator(self, votes: VoteDict):
+        return distribution
+
+    def _has_majority(self, vote_counts: Mapping[int, int]):
+        """
+        :param vote_counts: a mapping of candidates to their vote totals.
+        :return: whether any candidate has attained a majority.
         """
-        Performs instant runoff, and generates a vote distribution dictionary (``VoteDict``) for
-        each distinct stage of the runoff.
+        return max(vote_counts.values(), default=0) >= self._majority
 
-        :param votes: the initial vote distribution dictionary (``VoteDict``).
-        :return: a generator which generates VoteDicts for each stage of the election.
+    def _runoff_generator(self, distribution: _BallotDistribution):
         """
-        yield _copy_vote_dict(votes)
+        Performs instant runoff, and generates a snapshot (``RunoffStage``) of each distinct stage of the runoff.
 
-        has_majority = [len(ballots) > self._majority for _, ballots in votes.items()]
+        :param distribution: the initial distribution of the ballots.
+        :return: a generator which generates RunoffStages for each stage of the election.
+        """
+        vote_counts = distribution.count_votes(self._contested_candidates)
+
+        yield distribution.stage(vote_counts)
 
-        while not any(has_majority):
-            eliminated_candidates = _select_removable_candidates(votes)
+        while not self._has_majority(vote_counts):
+            eliminated_candidates = _select_removable_candidates(vote_counts)
 
             # There is a tie
-            if len(eliminated_candidates) == len(votes):
+            if len(eliminated_candidates) == len(vote_counts):
                 break
 
-            # Transfer votes from eliminated candidates and delete
-            self._transfer_votes(votes, eliminated_candidates)
+            distribution.eliminate(eliminated_candidates)
+            vote_counts = distribution.count_votes(vote_counts)
 
-            for eliminated_candidate in eliminated_candidates:
-                del votes[eliminated_candidate]
+            yield distribution.stage(vote_counts)
 
-            has_majority = [len(ballots) > self._majority for _, ballots in votes.items()]
+        self._add_winner(distribution.vote_dict(vote_counts), vote_counts)
 
-            yield _copy_vote_dict(votes)
+    def _add_winner(self, votes: VoteDict, vote_counts: Mapping[int, int]):
+        """
+        Adds the winner of a completed runoff to the winners, running the tiebreakers if required.
 
+        :param votes: the final vote distribution dictionary (``VoteDict``) of the runoff.
+        :param vote_counts: a mapping of the remaining candidates to their vote totals.
+        """
         # Compile list of winners
-        candidate_list = [(candidate, ballots) for candidate, ballots in votes.items()]
-        max_ballots = max([len(ballots) for _, ballots in candidate_list])
-        winner_list = [candidate for candidate, ballots in candidate_list if len(ballots) == max_ballots]
+        max_votes = max([count for _, count in vote_counts.items()])
+        winner_list = [candidate for candidate, count in vote_counts.items() if count == max_votes]
 
         num_winners = len(winner_list)
 
         if num_winners == 0:
             raise ValueError("No winners. This shouldn't be possible")
         elif num_winners == 1:
-            self.winners.add(winner_list[0])
+            self.winners.add(self._candidates[winner_list[0]])
         else:
             try:
                 winner, tiebreaker_iteration = self._run_tiebreaker(winner_list, votes)
-                self.notes[winner].append(f"determined by the {make_ordinal(tiebreaker_iteration)} tiebreaker")
-                self.winners.add(winner)
+                winner_name = self._candidates[winner]
+                self.notes[winner_name].append(f"determined by the {make_ordinal(tiebreaker_iteration)} tiebreaker")
+                self.winners.add(winner_name)
             except RuntimeError:
-                self.winners.add(f"A tie has occurred between {', '.join(winner_list)}")
-
-    def _transfer_votes(self, votes: VoteDict, eliminated_candidates: Set[str]):
-        """
-        Transfer votes from the candidates in ``eliminated_candidates`` to others as specified by their ranked ballot.
-
-        :param votes: the vote distribution dictionary (``VoteDict``) on which to operate .
-        :param eliminated_candidates: the set of candidates to be eliminated.
-        """
-        self._eliminated.update(eliminated_candidates)
-
-        for candidate in eliminated_candidates:
-            transferred_ballots = votes[candidate]
-
-            for ballot in transferred_ballots:
-                for choice in ballot:
-                    # Transfer ballot to first non-eliminated candidate
-                    if choice not in self._eliminated:
-                        votes[choice].append(ballot)
-                        break
+                tied_candidates = ', '.join(self._candidates[candidate] for candidate in winner_list)
+                self.winners.add(f"A tie has occurred between {tied_candidates}")
 
     def _run_tiebreaker(self,
-                        winner_list: list[str],
+                        winner_list: list[int],
                         votes: VoteDict, *,
-                        on_tie: Callable[[list[str]], None] | None = None
-                        ) -> tuple[str, Literal[1, 2]]:
+                        on_tie: Callable[[list[int]], None] | None = None
+                        ) -> tuple[int, Literal[1, 2]]:
         """
         Runs the tiebreaker procedure in the case that multiple candidates are tied.
 
@@ -248,7 +494,7 @@ class RankedChoiceRunner:
         winner = self._run_first_tiebreaker(winner_list, votes)
 
         if winner is None:
-            winner = self._run_second_tiebreaker(winner_list, self._data)
+            winner = self._run_second_tiebreaker(winner_list)
 
             if winner is None:
                 if on_tie is not None:
@@ -263,7 +509,7 @@ class RankedChoiceRunner:
 
         return winner, tiebreaker
 
-    def _run_first_tiebreaker(self, winner_list: list[str], votes: VoteDict):
+    def _run_first_tiebreaker(self, winner_list: list[int], votes: VoteDict):
         """
         Runs the first tiebreaker. **All votes belonging to each of the potential winning candidates** are
         reduced to a numerical point total where a first choice vote is worth ``N`` points, where ``N`` is the
@@ -273,40 +519,35 @@ class RankedChoiceRunner:
         :param votes: the current vote distribution dictionary (``VoteDict``) of the election.
         :return: the singular winner or ``None`` if no singular winner can be determined.
         """
-        tiebreaker_dict: defaultdict[str, int] = defaultdict(int)
+        points = [0] * len(self._candidates)
+        ballot_ranks = self.ballot_ranks
 
         for winner in winner_list:
             ballots = votes[winner]
 
             for ballot in ballots:
-                try:
-                    winner_index = ballot.index(winner)
-                except ValueError:
+                winner_index = ballot_ranks[ballot].get(winner)
+
+                if winner_index is None:
                     continue
 
-                tiebreaker_dict[winner] += (self._ballot_size - winner_index)
+                points[winner] += (self._ballot_size - winner_index) * self._data[ballot]
 
-        return _compute_tiebreaker_winner(tiebreaker_dict)
+        return _compute_tiebreaker_winner(_awarded_points(points, winner_list))
 
-    def _run_second_tiebreaker(self, winner_list: list[str], all_ballots: list[Ballot]):
+    def _run_second_tiebreaker(self, winner_list: list[int]):
         """
         Runs the second tiebreaker. **All votes cast in the election** are
         reduced to a numerical point total where a first choice vote is worth ``N`` points, where ``N`` is the
         amount of candidates, a second choice vote is worth ``(N-1)`` votes, and so on and so forth.
 
         :param winner_list: a list of the potential winning candidates.
-        :param all_ballots: all ballots cast in the election.
         :return: the singular winner or ``None`` if no singular winner can be distinguished.
         """
-        tiebreaker_dict: defaultdict[str, int] = defaultdict(int)
-
-        for winner in winner_list:
-            for ballot in all_ballots:
-                try:
-                    winner_index = ballot.index(winner)
-                except ValueError:
-                    continue
-
-                tiebreaker_dict[winner] += (self._ballot_size - winner_index)
+        # The points only depend on the ballots, so they are computed once for all seats
+        if self._total_points is None:
+            self._total_points = _count_ballot_points(
+                self._data, self.ballot_ranks, self._ballot_size, len(self._candidates)
+            )
 
-        return _compute_tiebreaker_winner(tiebreaker_dict)
+        return _compute_tiebreaker_winner(_awarded_points(self._total_points, winner_list))
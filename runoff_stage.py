@@ -0,0 +1,29 @@
+from dataclasses import dataclass
+from itertools import islice
+
+from custom_types import Ballot
+
+
+@dataclass(frozen=True, kw_only=True)
+class RunoffStage:
+    """
+    A dataclass containing a snapshot of one stage of an instant runoff. Only the vote totals are
+    copied for each stage; the ballots of a candidate are gathered when they are requested.
+
+    :param vote_counts: a mapping of each candidate remaining at the stage (by index, in order) to their vote total
+    :param ballots: the distinct ballots of the election
+    :param piles: the indices into ``ballots`` of the ballots assigned to each candidate. The piles of a
+                  runoff only ever grow, so they are shared by all of its stages
+    :param pile_sizes: a mapping of each candidate remaining at the stage to the size of their pile at the stage
+    """
+    vote_counts: dict[int, int]
+    ballots: list[Ballot]
+    piles: list[list[int]]
+    pile_sizes: dict[int, int]
+
+    def candidate_ballots(self, candidate: int) -> list[Ballot]:
+        """
+        :param candidate: a candidate remaining at the stage.
+        :return: the distinct ballots which count towards the candidate's vote total at the stage.
+        """
+        return [self.ballots[i] for i in islice(self.piles[candidate], self.pile_sizes[candidate])]
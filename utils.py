@@ -1,6 +1,11 @@
-_ORDINAL_SUFFIX_LIST = ['th', 'st', 'nd', 'rd', 'th']
+import gc
+from contextlib import contextmanager
+from functools import lru_cache
 
+_ORDINAL_SUFFIX_LIST = ('th', 'st', 'nd', 'rd', 'th')
 
+
+@lru_cache(maxsize=128)
 def make_ordinal(n: int):
     """
     Convert an integer into its ordinal representation.
@@ -19,3 +24,21 @@ def make_ordinal(n: int):
         suffix = _ORDINAL_SUFFIX_LIST[min(n % 10, 4)]
 
     return str(n) + suffix
+
+
+@contextmanager
+def gc_paused():
+    """
+    Context manager which pauses the cyclic garbage collector for the duration of the block.
+
+    Reference counting still frees objects as usual; only the generational collection passes,
+    which are triggered by the sheer number of container allocations, are skipped.
+    """
+    was_enabled = gc.isenabled()
+    gc.disable()
+
+    try:
+        yield
+    finally:
+        if was_enabled:
+            gc.enable()